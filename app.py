@@ -1,7 +1,8 @@
 # app.py — brand new Flask app (no prior code), dark mode + robust fallback
 from flask import Flask, render_template, request
+from flask.logging import default_handler
 import os, logging
-from core import SymptomCore
+from core import LOG_FORMAT, SymptomCore, queued_log_handler
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'symptomx-dev')
@@ -9,12 +10,16 @@ app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'symptomx-dev')
 # logging
 os.makedirs('logs', exist_ok=True)
 handler = logging.FileHandler('logs/app.log', encoding='utf-8')
-handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
-app.logger.addHandler(handler)
+handler.setFormatter(logging.Formatter(LOG_FORMAT))
+# records also propagate to the root (core) handler, which already echoes to the console
+app.logger.removeHandler(default_handler)
+app.logger.addHandler(queued_log_handler(handler))
 app.logger.setLevel(logging.INFO)
 
 # initialize core (always available due to built-in fallback)
 core = SymptomCore(data_dir='data')
+# the dataset is fixed for the life of the process, so the health payload is too
+_HEALTH = {'status': 'ok', 'diseases': core.n_diseases, 'vocab': core.n_vocab}
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
@@ -30,14 +35,14 @@ def index():
             possible = out.get('possible', [])
             message = out.get('message')
         except Exception as e:
-            app.logger.error(f"diagnose failed: {e}")
+            app.logger.error("diagnose failed: %s", e)
             # Even on exceptions, don't surface 'service unavailable'; give a friendly message.
             message = "Could not process that input. Try different wording (e.g., 'fever, cough')."
     return render_template('index.html', result=result, possible=possible, message=message, user_input=user_input)
 
 @app.route('/health')
 def health():
-    return {'status': 'ok', 'diseases': len(core.diseases), 'vocab': len(core.vocab)}, 200
+    return _HEALTH, 200
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', debug=True)
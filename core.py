@@ -1,21 +1,221 @@
 # core.py — brand new, offline, pure-Python diagnosis core
 from __future__ import annotations
-import json, os, logging, re
-from typing import List, Dict, Any, Tuple
+import atexit, hashlib, json, os, logging, pickle, re, sys, _thread
+import logging.handlers
+from _queue import SimpleQueue  # the C queue; gevent never patches it
+from array import array
+from functools import lru_cache
+from typing import List, Dict, Any, Set, Tuple
 
-# Logging
+import numpy as np
+
+try:
+    # Installed via requirements.txt; without it, matching falls back to one compiled regex
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+try:
+    # Optional accelerator: faster dataset parsing at start-up
+    from orjson import loads as _json_loads
+except ImportError:
+    _json_loads = json.loads
+
+try:
+    # Optional accelerator: JIT-compiles the per-disease scoring sweep
+    from numba import njit
+except ImportError:
+    njit = None
+_NUMBA_AVAILABLE = njit is not None
+
+# Logging: callers only enqueue records; a listener thread does the file/console writes
 LOG_DIR = "logs"
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 os.makedirs(LOG_DIR, exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler(os.path.join(LOG_DIR, "core.log"), encoding="utf-8"),
-        logging.StreamHandler()
-    ]
-)
+
+
+def _os_thread_primitives() -> Tuple[Any, Any]:
+    # under gevent's monkey patching threads are greenlets, which would run the listener's
+    # blocking writes on the worker's own hub; take the unpatched OS-level primitives instead
+    monkey = sys.modules.get("gevent.monkey")
+    if monkey is not None and monkey.is_module_patched("threading"):
+        return monkey.get_original("_thread", "start_new_thread"), monkey.get_original("_thread", "allocate_lock")
+    return _thread.start_new_thread, _thread.allocate_lock
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    """QueueListener whose monitor runs on a real OS thread even under gevent."""
+
+    def start(self) -> None:
+        start_new_thread, allocate_lock = _os_thread_primitives()
+        self._done = allocate_lock()
+        self._done.acquire()
+
+        def run() -> None:
+            try:
+                self._monitor()
+            finally:
+                self._done.release()
+
+        start_new_thread(run, ())
+
+    def stop(self) -> None:
+        self.enqueue_sentinel()
+        self._done.acquire()  # released once the monitor has drained the queue
+
+
+class _QueuedHandler(logging.handlers.QueueHandler):
+    """QueueHandler feeding a QueueListener that is owned by the current process."""
+
+    def __init__(self, handlers: Tuple[logging.Handler, ...]) -> None:
+        super().__init__(SimpleQueue())
+        self.setFormatter(logging.Formatter("%(message)s"))  # only merges args; the real handlers format
+        self.targets = handlers
+        self._start_listener()
+
+    def _start_listener(self) -> None:
+        self.pid = os.getpid()
+        self.listener = _QueueListener(self.queue, *self.targets, respect_handler_level=True)
+        self.listener.start()
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        # runs under self.lock; the listener thread does not survive fork (gunicorn preload_app),
+        # so a forked worker starts its own, on a fresh queue, on first use
+        if self.pid != os.getpid():
+            self.queue = SimpleQueue()
+            self._start_listener()
+        super().enqueue(record)
+
+
+_queued_handlers: List[_QueuedHandler] = []
+
+
+def queued_log_handler(*handlers: logging.Handler) -> logging.handlers.QueueHandler:
+    """Return a QueueHandler whose records are written to handlers off the calling thread."""
+    qh = _QueuedHandler(handlers)
+    _queued_handlers.append(qh)
+    return qh
+
+
+@atexit.register
+def _stop_log_listeners() -> None:
+    for qh in _queued_handlers:
+        if qh.pid == os.getpid():
+            qh.listener.stop()  # drains whatever is still queued
+
+
+_log_handlers: List[logging.Handler] = [
+    logging.FileHandler(os.path.join(LOG_DIR, "core.log"), encoding="utf-8"),
+    logging.StreamHandler()
+]
+for _h in _log_handlers:
+    _h.setFormatter(logging.Formatter(LOG_FORMAT))
+logging.basicConfig(level=logging.INFO, handlers=[queued_log_handler(*_log_handlers)])
 logger = logging.getLogger("core")
 
+# Precompiled patterns for the tokenizer and the symptom-string splitter
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:'[a-z0-9]+)?")
+_SPLIT_RE = re.compile(r"[,;/\n]")
+_WS_RE = re.compile(r"\s+")
+# Maximal runs of token characters in a phrase; a user token can only occur inside one of these
+_RUN_RE = re.compile(r"[a-z0-9']+")
+# ASCII fast path for the tokenizer: everything but [a-z0-9'] becomes a separator
+_TOKEN_TR = str.maketrans({c: " " for c in map(chr, range(128)) if not (c.isalnum() or c == "'")})
+
+
+def _tokenize(text: str) -> Tuple[str, ...]:
+    # phrases are matched with substring containment; tokens are used for light weight scoring
+    text = (text or "").lower()
+    if not text.isascii():
+        return tuple(_TOKEN_RE.findall(text))
+    tokens = text.translate(_TOKEN_TR).split()
+    if "'" in text:
+        # an apostrophe only belongs to a token between two alphanumerics ("don't")
+        return tuple(t for tok in tokens for t in (_TOKEN_RE.findall(tok) if "'" in tok else (tok,)))
+    return tuple(tokens)
+
+
+# Symptom phrases repeat across diseases, so index building memoizes these helpers; they
+# return tuples so cached results cannot be mutated. Request text is never cached here.
+@lru_cache(maxsize=8192)
+def _phrase_runs(phrase: str) -> Tuple[str, ...]:
+    return tuple(_RUN_RE.findall(phrase))
+
+
+@lru_cache(maxsize=4096)
+def _split_symptoms(text: str) -> Tuple[str, ...]:
+    # "a, b; c" -> phrases; a string with no separators falls back to single words
+    parts = [s.strip() for s in _SPLIT_RE.split(text) if s.strip()]
+    if parts or not text:
+        return tuple(parts)
+    return tuple(w.strip() for w in _WS_RE.split(text) if w.strip())
+
+
+# Bump when the set or layout of cached index fields changes
+_CACHE_VERSION = 7
+
+
+def _code_digest() -> str:
+    # part of the cache signature, so any edit to the indexing code invalidates old caches
+    try:
+        with open(__file__, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return ""
+
+
+_CODE_DIGEST = _code_digest()
+
+# Payload keys in the phrase-word trie; neither can be a token character
+_TRIE_SUB = ""
+_TRIE_PHRASE = "$"
+
+
+def _score_sweep_loop(rows, indptr, indices, hit_mask, th, denom, ntok):
+    # CSR sweep over the given rows: disease d owns phrase ids indices[indptr[d]:indptr[d + 1]]
+    scores = np.empty(rows.shape[0], np.float64)
+    for k in range(rows.shape[0]):
+        d = rows[k]
+        ph = 0
+        for j in range(indptr[d], indptr[d + 1]):
+            ph += hit_mask[indices[j]]
+        scores[k] = 0.7 * (ph / denom[d]) + 0.3 * (th[d] / ntok)
+    return scores
+
+
+def _score_sweep_numpy(rows, indptr, indices, hit_mask, th, denom, ntok):
+    # same sweep without numba: per-row hit counts from a running sum over the CSR values
+    csum = np.concatenate(([0], np.cumsum(hit_mask[indices])))
+    ph = csum[indptr[rows + 1]] - csum[indptr[rows]]
+    return 0.7 * (ph / denom[rows]) + 0.3 * (th[rows] / ntok)
+
+
+_score_sweep = njit(cache=True)(_score_sweep_loop) if _NUMBA_AVAILABLE else _score_sweep_numpy
+
+# Candidate selection + scoring sweep, generated per dataset by SymptomCore._specialize_scan:
+# the disease count is baked in as a literal and the index arrays are bound as defaults,
+# so the hot path does no attribute lookups on self.
+_SCAN_TEMPLATE = """
+def _scan(hit_mask, hit_ids, token_ds, ntok, _np=np, _sweep=_score_sweep,
+          _ptr=indptr, _ind=indices, _pptr=phrase_indptr, _pind=phrase_indices, _denom=denom):
+    th = _np.bincount(token_ds, minlength=%(n)d)
+    # only diseases sharing a hit phrase or a token can score above zero; sweep just those
+    cand = _np.unique(_np.concatenate(
+        [_pind[_pptr[pid]:_pptr[pid + 1]] for pid in hit_ids] + [_np.asarray(token_ds, _np.int32)]))
+    scores = _np.zeros(%(n)d, _np.float64)
+    if cand.size:
+        scores[cand] = _sweep(cand, _ptr, _ind, hit_mask, th, _denom, ntok)
+    return scores
+"""
+
+# Longest normalized input whose diagnose result is cached; longer (unrealistic) inputs
+# are scored directly so request bodies cannot pin large keys in memory
+_CACHE_MAX_INPUT = 256
+
+# Returned as-is for blank input; shared by every caller, so never mutate it
+_EMPTY_RESULT: Dict[str, Any] = {"primary": None, "possible": [], "message": "Please enter your symptoms."}
+
+
 class SymptomCore:
     """Self-contained diagnosis without external downloads.
 
@@ -25,46 +225,72 @@ class SymptomCore:
 
     - Scores via token/phrase overlap; returns deterministic results.
 
+    - The index is built once at load and diagnose only reads it, so a single
+      instance can be shared by threads, greenlets and pre-forked workers.
+
     """
+    # Everything _build_vocab derives from the dataset; pickled next to the source file
+    _CACHED_FIELDS = (
+        "disease_names", "treatments", "vocab",
+        "_indptr", "_indices", "_denom", "_phrase_indptr", "_phrase_indices", "_trie", "_ac", "_phrase_re", "_contained",
+    )
+
     def __init__(self, data_dir: str = "data") -> None:
         self.data_dir = data_dir
-        self.diseases: List[Dict[str, Any]] = []
+        # Diseases are stored column-wise: index d into the names/treatments lists and
+        # the CSR arrays; every phrase string lives once in vocab, referenced by id.
+        self.disease_names: List[str] = []
+        self.treatments: List[str] = []
         self.vocab: List[str] = []
+        # diagnose is deterministic in (normalized text, top_k); short repeats are served from here
+        self._diagnose_cached = lru_cache(maxsize=2048)(self._diagnose_impl)
         self._load_data()
 
     def _load_data(self) -> None:
         # Priority: diseases.json -> diseases.csv -> built-in sample
         json_path = os.path.join(self.data_dir, "diseases.json")
         csv_path  = os.path.join(self.data_dir, "diseases.csv")
+        source = json_path if os.path.exists(json_path) else csv_path if os.path.exists(csv_path) else None
+        if source and self._load_cache(source):
+            return
         loaded = False
+        rows: List[Dict[str, Any]] = []
         if os.path.exists(json_path):
             try:
-                with open(json_path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
+                with open(json_path, "rb") as f:
+                    data = _json_loads(f.read())
                 if isinstance(data, list) and data:
-                    self.diseases = self._normalize(data)
-                    loaded = True
-                    logger.info("Loaded %d diseases from %s", len(self.diseases), json_path)
+                    rows = self._normalize(data)
+                    loaded = json_path
+                    logger.info("Loaded %d diseases from %s", len(rows), json_path)
             except Exception as e:
                 logger.error("Failed to parse %s: %s", json_path, e)
         if not loaded and os.path.exists(csv_path):
             try:
                 # Simple CSV reader without pandas
                 import csv
-                rows = []
                 with open(csv_path, "r", encoding="utf-8") as f:
-                    reader = csv.DictReader(f)
-                    for r in reader:
-                        rows.append(r)
-                if rows:
-                    self.diseases = self._normalize(rows)
-                    loaded = True
-                    logger.info("Loaded %d diseases from %s", len(self.diseases), csv_path)
+                    reader = csv.reader(f)
+                    header = next(reader, [])
+                    # resolve _normalize's column preferences once, then unpack rows by position
+                    cols = [[header.index(c) for c in names if c in header]
+                            for names in (("disease", "name"), ("treatment", "care"), ("symptoms_normalized", "symptoms"))]
+
+                    def first(r: List[str], idx: List[int]) -> Any:
+                        for i in idx:
+                            if i < len(r) and r[i]:
+                                return r[i]
+                        return None
+                    raw = [[first(r, idx) for idx in cols] for r in reader if r]
+                if raw:
+                    rows = [self._normalize_fields(*fields) for fields in raw]
+                    loaded = csv_path
+                    logger.info("Loaded %d diseases from %s", len(rows), csv_path)
             except Exception as e:
                 logger.error("Failed to parse %s: %s", csv_path, e)
         if not loaded:
             # Built-in minimal fallback (always available)
-            self.diseases = self._normalize([
+            rows = self._normalize([
                 {
                     "disease": "Common Cold",
                     "symptoms": "sneezing, runny nose, sore throat, mild cough, congestion",
@@ -81,71 +307,268 @@ class SymptomCore:
                     "treatment": "rest in dark room, hydration, triptans/NSAIDs per guidance"
                 }
             ])
-            logger.warning("Using built-in fallback dataset: %d diseases", len(self.diseases))
-        self._build_vocab()
+            logger.warning("Using built-in fallback dataset: %d diseases", len(rows))
+        self._build_vocab(rows)
+        if loaded == source:
+            self._save_cache(source)
+
+    @staticmethod
+    def _cache_signature(source: str) -> List[Any]:
+        st = os.stat(source)
+        return [_CACHE_VERSION, _CODE_DIGEST, st.st_mtime_ns, st.st_size, ahocorasick is not None]
+
+    def _load_cache(self, source: str) -> bool:
+        """Restore the prebuilt index for source if its cache is still valid."""
+        cache_path = source + ".cache"
+        if not os.path.exists(cache_path):
+            return False
+        try:
+            with open(cache_path, "rb") as f:
+                # the signature is a plain JSON header line, checked before anything is unpickled
+                if json.loads(f.readline(4096)) != self._cache_signature(source):
+                    return False
+                state = pickle.load(f)
+            for name in self._CACHED_FIELDS:
+                setattr(self, name, state[name])
+        except Exception as e:
+            logger.warning("Ignoring unreadable cache %s: %s", cache_path, e)
+            return False
+        self._index_ready()
+        logger.info("Loaded %d diseases from %s (cached index)", len(self.disease_names), cache_path)
+        return True
+
+    def _save_cache(self, source: str) -> None:
+        cache_path = source + ".cache"
+        tmp_path = "%s.%d.tmp" % (cache_path, os.getpid())
+        try:
+            header = json.dumps(self._cache_signature(source)).encode("utf-8") + b"\n"
+            state = {name: getattr(self, name) for name in self._CACHED_FIELDS}
+            with open(tmp_path, "wb") as f:
+                f.write(header)
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            # atomic swap so concurrently booting workers never read a partial file
+            os.replace(tmp_path, cache_path)
+        except Exception as e:
+            logger.warning("Could not write cache %s: %s", cache_path, e)
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
 
     def _normalize(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         normed = []
         for row in items:
-            disease = str(row.get("disease") or row.get("name") or "Unknown").strip()
-            treatment = str(row.get("treatment") or row.get("care") or "").strip()
-            if isinstance(row.get("normalized_symptoms_list"), list):
-                syms = [str(x).strip().lower() for x in row["normalized_symptoms_list"] if str(x).strip()]
-            else:
-                text = str(row.get("symptoms_normalized") or row.get("symptoms") or "").lower()
-                parts = [s.strip() for s in re.split(r",|;|/|\n", text) if s.strip()]
-                syms = parts if parts else ([w.strip() for w in re.split(r"\s+", text) if w.strip()] if text else [])
-            normed.append({"disease": disease, "treatment": treatment, "normalized_symptoms_list": syms})
+            symptoms = row.get("normalized_symptoms_list")
+            if not isinstance(symptoms, list):
+                # only normalized_symptoms_list is taken as a phrase list; anything else is text
+                symptoms = str(row.get("symptoms_normalized") or row.get("symptoms") or "")
+            normed.append(self._normalize_fields(row.get("disease") or row.get("name"),
+                                                 row.get("treatment") or row.get("care"), symptoms))
         return normed
 
-    def _build_vocab(self) -> None:
-        seen = set()
+    @staticmethod
+    def _normalize_fields(disease: Any, treatment: Any, symptoms: Any) -> Dict[str, Any]:
+        """Normalize one row; symptoms is a ready phrase list or a raw symptom string."""
+        if isinstance(symptoms, list):
+            syms = [str(x).strip().lower() for x in symptoms if str(x).strip()]
+        else:
+            syms = list(_split_symptoms(str(symptoms or "").lower()))
+        return {
+            "disease": str(disease or "Unknown").strip(),
+            "treatment": str(treatment or "").strip(),
+            "normalized_symptoms_list": syms,
+        }
+
+    def _build_vocab(self, rows: List[Dict[str, Any]]) -> None:
+        seen: Dict[str, int] = {}
         vocab = []
-        for row in self.diseases:
-            for p in row.get("normalized_symptoms_list", []):
-                if p and p not in seen:
-                    seen.add(p); vocab.append(p)
+        indptr: List[int] = [0]
+        indices: List[int] = []
+        disease_phrases: List[List[str]] = []
+        run_diseases: Dict[str, Set[int]] = {}
+        for i, row in enumerate(rows):
+            # a phrase repeated within one row counts once, in both the score and "matched"
+            phrases = list(dict.fromkeys(sys.intern(p) for p in row.get("normalized_symptoms_list", []) if p))
+            for p in phrases:
+                pid = seen.get(p)
+                if pid is None:
+                    pid = seen[p] = len(vocab)
+                    vocab.append(p)
+                indices.append(pid)
+                for w in _phrase_runs(p):
+                    run_diseases.setdefault(w, set()).add(i)
+            indptr.append(len(indices))
+            disease_phrases.append(phrases)
+        self.disease_names = [row["disease"] for row in rows]
+        self.treatments = [row["treatment"] for row in rows]
         self.vocab = vocab
+        # disease -> phrase ids in CSR form, plus per-disease denominators
+        self._indptr = np.asarray(indptr, dtype=np.int32)
+        self._indices = np.asarray(indices, dtype=np.int32)
+        self._denom = np.maximum(np.diff(self._indptr).astype(np.float64), 1.0)
+        # the same matrix transposed (phrase id -> diseases listing it) for candidate lookup
+        rows_of = np.repeat(np.arange(len(rows), dtype=np.int32), np.diff(self._indptr))
+        self._phrase_indices = rows_of[np.argsort(self._indices, kind="stable")]
+        self._phrase_indptr = np.concatenate(
+            ([0], np.cumsum(np.bincount(self._indices, minlength=len(vocab))))).astype(np.int32)
+        self._trie = self._build_trie(run_diseases, disease_phrases)
+        self._ac = None
+        self._phrase_re = None
+        self._contained: Dict[str, array] = {}
+        if ahocorasick is not None and vocab:
+            ac = ahocorasick.Automaton()
+            for pid, p in enumerate(vocab):
+                ac.add_word(p, pid)
+            ac.make_automaton()
+            self._ac = ac
+        elif vocab:
+            # One alternation for the whole vocab, longest first; the lookahead lets matches overlap
+            by_len = sorted(vocab, key=len, reverse=True)
+            self._phrase_re = re.compile("(?=(%s))" % "|".join(map(re.escape, by_len)))
+            # The longest phrase matched at a position implies every vocab phrase inside it
+            self._contained = {p: array("i", (pid for pid, q in enumerate(vocab) if q in p)) for p in vocab}
+        self._index_ready()
         logger.info("Vocab built: %d phrases", len(self.vocab))
 
+    def _index_ready(self) -> None:
+        """Run once the index is in place, whether freshly built or restored from cache."""
+        self.n_diseases = n = len(self.disease_names)
+        self.n_vocab = len(self.vocab)
+        # per-disease phrase ids as zero-copy int32 views into the CSR values
+        self._disease_phrase_ids = np.split(self._indices, self._indptr[1:-1])
+        self._scan = self._specialize_scan()
+        if _NUMBA_AVAILABLE:
+            # compile (or load from numba's on-disk cache) now rather than on the first request
+            _score_sweep(np.arange(n, dtype=np.int32), self._indptr, self._indices,
+                         np.zeros(self.n_vocab, np.uint8), np.zeros(n, np.intp), self._denom, 1.0)
+        self._diagnose_cached.cache_clear()
+
+    def _specialize_scan(self) -> Any:
+        """Compile _SCAN_TEMPLATE against this (now immutable) index."""
+        env = {
+            "np": np, "_score_sweep": _score_sweep,
+            "indptr": self._indptr, "indices": self._indices, "denom": self._denom,
+            "phrase_indptr": self._phrase_indptr, "phrase_indices": self._phrase_indices,
+        }
+        exec(compile(_SCAN_TEMPLATE % {"n": self.n_diseases}, "<SymptomCore._scan>", "exec"), env)
+        return env["_scan"]
+
+    def _build_trie(self, run_diseases: Dict[str, Set[int]], disease_phrases: List[List[str]]) -> Dict[str, Any]:
+        """Suffix trie over phrase runs for the token <-> phrase substring checks.
+
+        Every suffix of every maximal [a-z0-9'] run of a phrase is inserted, so
+        each node stands for a substring; node[_TRIE_SUB] lists the diseases
+        having a phrase containing it. Phrases that are a single run additionally
+        carry node[_TRIE_PHRASE] at their end node, which finds phrases sitting
+        inside a longer user token.
+        """
+        root: Dict[str, Any] = {}
+        for w, ds in run_diseases.items():
+            for start in range(len(w)):
+                node = root
+                for ch in w[start:]:
+                    node = node.setdefault(ch, {})
+                    node.setdefault(_TRIE_SUB, set()).update(ds)
+        for i, phrases in enumerate(disease_phrases):
+            for p in phrases:
+                if not _RUN_RE.fullmatch(p):
+                    continue  # a phrase with separators can never sit inside a single token
+                node = root
+                for ch in p:
+                    node = node[ch]
+                node.setdefault(_TRIE_PHRASE, set()).add(i)
+
+        def freeze(node: Dict[str, Any]) -> None:
+            for key, val in node.items():
+                if key in (_TRIE_SUB, _TRIE_PHRASE):
+                    node[key] = array("i", sorted(val))
+                else:
+                    freeze(val)
+        freeze(root)
+        return root
+
+    def _token_diseases(self, t: str) -> Set[int]:
+        """Diseases with a phrase containing token t, or a one-word phrase inside t."""
+        found: Set[int] = set()
+        node = self._trie
+        for ch in t:
+            node = node.get(ch)
+            if node is None:
+                break
+        else:
+            found.update(node.get(_TRIE_SUB, ()))
+        for start in range(len(t)):
+            node = self._trie
+            for ch in t[start:]:
+                node = node.get(ch)
+                if node is None:
+                    break
+                found.update(node.get(_TRIE_PHRASE, ()))
+        return found
+
+    def _match_phrases(self, utext: str) -> Set[int]:
+        """Ids of every vocab phrase occurring as a substring of utext."""
+        if self._ac is not None:
+            return {pid for _, pid in self._ac.iter(utext)}
+        hits: Set[int] = set()
+        if self._phrase_re is not None:
+            for m in self._phrase_re.finditer(utext):
+                hits.update(self._contained[m.group(1)])
+        return hits
+
     @staticmethod
-    def _tokenize(text: str) -> List[str]:
-        text = (text or "").lower()
-        # phrases are matched with substring containment; tokens are used for light weight scoring
-        tokens = re.findall(r"[a-z0-9]+(?:'[a-z0-9]+)?", text)
-        return tokens
+    def _top_indices(scores: np.ndarray, k: int) -> np.ndarray:
+        """Indices of the k best scores, best first; ties keep dataset order."""
+        n = scores.shape[0]
+        if k < n:
+            # O(n) selection of the k-th best score, then only the survivors get sorted
+            kth = -np.partition(-scores, k - 1)[k - 1]
+            above = np.flatnonzero(scores > kth)
+            tied = np.flatnonzero(scores == kth)[:k - above.size]
+            idx = np.concatenate((above, tied))
+        else:
+            idx = np.arange(n)
+        return idx[np.lexsort((idx, -scores[idx]))]
 
     def diagnose(self, user_text: str, top_k: int = 5) -> Dict[str, Any]:
-        """Return a dict with primary + others. Never raises for normal inputs."""
+        """Return a dict with primary + others. Never raises for normal inputs.
+
+        Results (including the blank-input message) are shared between calls;
+        treat them as read-only.
+        """
         user_text = (user_text or "").strip()
         if not user_text:
-            return {"primary": None, "possible": [], "message": "Please enter your symptoms."}
-
+            return _EMPTY_RESULT
         utext = user_text.lower()
-        tokens = set(self._tokenize(utext))
-
-        scored: List[Tuple[float, Dict[str, Any], List[str]]] = []
-        for row in self.diseases:
-            phrases = [p for p in row.get("normalized_symptoms_list", []) if p]
-            # phrase hits (substring match) + token overlap
-            phrase_hits = [p for p in phrases if p in utext]
-            token_hits = [t for t in tokens if any(t in p or p in t for p in phrases)]
-            # score: weighted combo of phrase hits and token hits, normalized
-            ph = len(phrase_hits)
-            th = len(set(token_hits))
-            denom = max(len(phrases), 1)
-            score = (0.7 * (ph / denom)) + (0.3 * (th / (len(tokens) or 1)))
-            scored.append((score, row, phrase_hits))
-        scored.sort(key=lambda x: x[0], reverse=True)
-        top = scored[:max(1, top_k)]
-
-        def to_item(score: float, row: Dict[str, Any], hits: List[str]) -> Dict[str, Any]:
+        if len(utext) > _CACHE_MAX_INPUT:
+            return self._diagnose_impl(utext, top_k)
+        return self._diagnose_cached(utext, top_k)
+
+    def _diagnose_impl(self, utext: str, top_k: int) -> Dict[str, Any]:
+        tokens = set(_tokenize(utext))
+
+        # phrase hits (substring match): one pass over utext, marked by phrase id
+        hit_ids = list(self._match_phrases(utext))
+        hit_mask = np.zeros(self.n_vocab, np.uint8)
+        hit_mask[hit_ids] = 1
+        # token overlap: token inside a phrase or phrase inside a token, via the suffix trie
+        token_ds = [d for t in tokens for d in self._token_diseases(t)]
+
+        # score: weighted combo of phrase hits and token hits, normalized
+        scores = self._scan(hit_mask, hit_ids, token_ds, float(len(tokens) or 1))
+        top = self._top_indices(scores, max(1, top_k))
+        # confidence as a percentage with one decimal, for the whole top-k at once
+        # (Python's round, not np.round: the latter scales by 10 first and disagrees near .x5)
+        pct = [round(c, 1) for c in (np.clip(scores[top], 0.0, 1.0) * 100.0).tolist()]
+
+        def to_item(d: int, confidence: float) -> Dict[str, Any]:
+            pids = self._disease_phrase_ids[d]
             return {
-                "disease": row.get("disease", "Unknown"),
-                "treatment": row.get("treatment", ""),
-                "confidence": round(100.0 * max(0.0, min(1.0, score)), 1),
-                "matched": hits
+                "disease": self.disease_names[d],
+                "treatment": self.treatments[d],
+                "confidence": confidence,
+                "matched": [self.vocab[pid] for pid in pids[hit_mask[pids] == 1]]
             }
-        items = [to_item(s, r, h) for (s, r, h) in top]
+        items = [to_item(d, c) for d, c in zip(top.tolist(), pct)]
         primary = items[0] if items else None
         return {"primary": primary, "possible": items[1:]}
@@ -0,0 +1,9 @@
+# gunicorn.conf.py — production server settings, picked up by `gunicorn app:app`
+import multiprocessing, os
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "gevent"
+
+# Build SymptomCore once in the master; forked workers share its index copy-on-write
+preload_app = True